@@ -68,20 +68,56 @@ __author__ = "alastair@mcc-net.co.uk (Alastair McCormack)"
 import cgi
 import os.path
 import logging
+import Queue
+import random
 import sys
-import xml.dom.minidom
 import hashlib
 import hmac
 import json
-import codecs
-import urllib2
 import urllib
-import cookielib
 import re
+import threading
 import time
 import urlparse
+import xml.sax.saxutils
 from optparse import OptionParser, OptionGroup
 
+# lxml and requests are imported on first use: sign and verify never load
+# requests, and actions that only talk to the GSA never load lxml.
+etree = None
+_XML_PARSER = None
+requests = None
+HTTPAdapter = None
+
+
+def _importLxml():
+  global etree, _XML_PARSER
+  if etree is not None:
+    return
+  try:
+    from lxml import etree
+  except ImportError:
+    print ('Missing a Python library: please execute "sudo pip install lxml"'
+           '\nPossibly "sudo aptitude install python-lxml"')
+    sys.exit(1)
+  # CDATA sections must survive a parse/serialize round trip as the GSA
+  # signs them verbatim. Config exports with UAR data can have huge text nodes.
+  _XML_PARSER = etree.XMLParser(strip_cdata=False, huge_tree=True,
+                                resolve_entities=False)
+
+
+def _importRequests():
+  global requests, HTTPAdapter
+  if requests is not None:
+    return
+  try:
+    import requests
+    from requests.adapters import HTTPAdapter
+  except ImportError:
+    print ('Missing a Python library: please execute "sudo pip install requests"'
+           '\nPossibly "sudo aptitude install python-requests"')
+    sys.exit(1)
+
 # Required for utf-8 file compatibility
 reload(sys)
 sys.setdefaultencoding("utf-8")
@@ -91,16 +127,190 @@ class NullHandler(logging.Handler):
     def emit(self, record):
         pass
 
+class UsageError(Exception):
+  """Bad or missing command line options. __main__ logs it and exits with code."""
+  code = 3
+
 DEFAULTLOGLEVEL=logging.DEBUG
 log = logging.getLogger(__name__)
 log.addHandler(NullHandler())
 
+# Patterns for scraping Admin Console pages, compiled once
+# Pre 7.2 has "Google Search Appliance  &gt;Home"
+_HOME_PATTERN = re.compile(r"Google Search Appliance\s*&gt;\s*Home")
+# 7.2 and later returns JSON like object
+_HOME72_PATTERN = re.compile(r'"xsrf": \[null,"security_token","')
+# The login form, served when the session is missing or has expired
+_LOGIN_FORM_PATTERN = re.compile(r'value=["\']authenticateUser["\']')
+_TOKEN_PATTERN = re.compile(r'name="security_token"[^>]*value="([^"]*)"', re.I)
+_HREF_PATTERN = re.compile(r'<a href="(.*?)"')
+# Crawl diagnostics pages worth following: any contentDiagnostics link that
+# is not a listing of excluded, errored or successful URLs
+_DIAGNOSTICS_LINK_PATTERN = re.compile(
+    r'(?!.*(?:sort=excluded|sort=errors|view=excluded|view=successful|view=errors))'
+    r'.*actionType=contentDiagnostics', re.DOTALL)
+_CONTENT_STATUS_LINK_PATTERN = re.compile(r'actionType=contentStatus')
+_NODE_PATTERN = re.compile(r"row.*(<b>.*</b>)")
+_CONN_STATUS_PATTERN = re.compile(r"(green|red) button")
+_DETAILED_STATUS_PATTERN = re.compile(r'Detailed Status(.*)"Balls">', re.DOTALL)
+_TAG_PATTERN = re.compile(r'<[^<]*?/?>')
+# Strips tags from the detailed status table in one pass, turning the cell
+# boundaries into separators on the way (see _CELL_SEPARATORS).
+_DETAILED_STATUS_MARKUP_PATTERN = re.compile(r'</td>([\n ])<td [^<]*?/?>|<[^<]*?/?>')
+_CELL_SEPARATORS = {'\n': ': ', ' ': ' | '}
+
+# Every message importConfig looks for in the GSA response
+_IMPORT_RESULT_PATTERN = re.compile(r"Invalid file|"
+                                    r"Wrong passphrase or the file is corrupt|"
+                                    r"Passphrase should be at least 8 characters long|"
+                                    r"File does not exist|"
+                                    r"Configuration imported successfully")
+
+# Downloads are written out in chunks of this size as they arrive
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Either message means the support script output could not be downloaded
+_SSCRIPT_ERROR_PATTERN = re.compile(r"Unable to download results|"
+                                    r"Error when trying to retrieve support script output")
+
+# Concurrent page fetches in getAllUrls; kept below the session pool_maxsize
+_CRAWL_WORKERS = 8
+# Concurrent requests when an action is given several frontends, collections or databases
+_FANOUT_WORKERS = 4
+
+_URL_ALL_PATTERN = re.compile(r"view=all.>(.*)</a>")
+_URL_SUCCESSFUL_PATTERN = re.compile(r"view=successful.>(.*)</a>")
+_URL_ERRORS_PATTERN = re.compile(r"view=errors.>(.*)</a>")
+_URL_EXCLUDED_PATTERN = re.compile(r"view=excluded.>(.*)</a>")
+
+# Markup in libxml2 output, for redoing its escaping the way minidom did
+_MARKUP_PATTERN = re.compile(r'(<!\[CDATA\[.*?\]\]>|<!--.*?-->|<\?.*?\?>|<[^>]*>)', re.DOTALL)
+_TAG_NAME_PATTERN = re.compile(r'<(/?)([^\s/>!?]+)')
+_START_TAG_PATTERN = re.compile(r'<([^\s/>!?]+)[^>]*(?<!/)>$')
+_ATTRIBUTE_PATTERN = re.compile(r' ([^\s=]+)="([^"]*)"')
+
+
+def _minidomParts(node):
+  """Serialize an lxml element, without its tail, the way minidom's toxml() did.
+
+  The GSA signature is an HMAC over minidom's output, so configs signed by
+  earlier versions of this tool must serialize identically.  minidom escaped "
+  in text and wrote CR and attribute newlines/tabs raw; it wrote attributes,
+  namespace declarations included, sorted by name and dropped empty CDATA
+  sections.
+
+  Known differences: adjacent CDATA sections are merged by libxml2 when
+  parsing, and entity references are not expanded.  GSA exports have neither.
+
+  Returns:
+    A list of strings, each one a start or end tag, CDATA section, comment,
+    processing instruction or the text in between.  Join them with
+    _joinMinidomParts().
+  """
+  parts = []
+  xmlString = etree.tostring(node, encoding="utf-8", with_tail=False)
+  for index, part in enumerate(_MARKUP_PATTERN.split(xmlString)):
+    if index % 2 == 0:
+      part = part.replace('"', '&quot;').replace('&#13;', '\r')
+      if parts and not parts[-1].startswith('<'):
+        # Text on both sides of a dropped CDATA section was one text node
+        parts[-1] += part
+        continue
+    elif part == '<![CDATA[]]>':
+      continue
+    elif not part.startswith(('<![CDATA[', '<!--', '<?')):
+      part = part.replace('&#10;', '\n').replace('&#13;', '\r').replace('&#9;', '\t')
+      attributes = _ATTRIBUTE_PATTERN.findall(part)
+      if len(attributes) > 1:
+        part = (_TAG_NAME_PATTERN.match(part).group()
+                + ''.join(' %s="%s"' % attribute for attribute in sorted(attributes))
+                + part[len(part.rstrip('/>')):])
+    if part:
+      parts.append(part)
+  return parts
+
+
+def _elementSpan(parts, tagName):
+  """Return the (start, end) slice of _minidomParts() holding the first
+  tagName element, matched like minidom's getElementsByTagName()."""
+  start = None
+  depth = 0
+  for index, part in enumerate(parts):
+    tag = _TAG_NAME_PATTERN.match(part)
+    if not tag:
+      continue
+    if start is None:
+      if tag.group(1) or tag.group(2) != tagName:
+        continue
+      start = index
+    if tag.group(1):
+      depth -= 1
+    elif not part.endswith('/>'):
+      depth += 1
+    if depth == 0:
+      return start, index + 1
+  return None
+
+
+def _joinMinidomParts(parts):
+  """Join _minidomParts(), writing elements without children as <tag/>."""
+  out = []
+  for part in parts:
+    startTag = out and _START_TAG_PATTERN.match(out[-1])
+    if startTag and part == '</%s>' % startTag.group(1):
+      out[-1] = out[-1][:-1] + '/>'
+    else:
+      out.append(part)
+  return ''.join(out)
+
+
+def _mapConcurrently(func, items, workers):
+  """Call func on each of items from up to workers threads.
+
+  Returns the results in the order of items.  If a call raises (including
+  SystemExit), the remaining items are skipped and the exception is re-raised
+  in the calling thread.
+  """
+  pending = Queue.Queue()
+  for index, item in enumerate(items):
+    pending.put((index, item))
+  results = [None] * len(items)
+  errors = []
+
+  def worker():
+    while not errors:
+      try:
+        index, item = pending.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        results[index] = func(item)
+      except BaseException:
+        errors.append(sys.exc_info())
+
+  threads = [threading.Thread(target=worker)
+             for i in range(min(workers, len(items)))]
+  for t in threads:
+    t.daemon = True
+    t.start()
+  for t in threads:
+    # A join without a timeout can't be interrupted by Ctrl-C on Python 2
+    while t.is_alive():
+      t.join(0.5)
+  if errors:
+    raise errors[0][0], errors[0][1], errors[0][2]
+  return results
+
+
 class gsaConfig:
   "Google Search Appliance XML configuration tool"
 
   configXMLString = None
+  # Parsed configXMLString, shared by sign/verify/write
+  _doc = None
 
   def __init__(self, fileName=None):
+    _importLxml()
     if fileName:
       self.openFile(fileName)
 
@@ -112,90 +322,121 @@ class gsaConfig:
     if not os.path.exists(fileName):
       log.error("Input file does not exist")
       sys.exit(1)
-    configXMLdoc = open(fileName)
+    configXMLdoc = open(fileName, 'rb')
     self.configXMLString = configXMLdoc.read()
     configXMLdoc.close()
+    self._doc = None
 
   def setXMLContents(self, xmlString):
     "Sets the runtime XML contents"
     self.configXMLString = xmlString.encode("utf-8")
+    self._doc = None
     #log.warning("Signature maybe invalid. Please verify before uploading or saving")
 
   def getXMLContents(self):
     "Returns the contents of the XML file"
     return self.configXMLString.encode("utf-8")
 
+  def _getDoc(self):
+    "Returns the parsed XML contents, parsing them only once"
+    if self._doc is None:
+      self._doc = etree.fromstring(self.getXMLContents(), _XML_PARSER)
+    return self._doc
+
   def computeSignature(self, password):
+    # Both HMACs below use the same key: set up the keyed state once and copy it
+    passwordHmac = hmac.new(password, digestmod=hashlib.sha1)
+    # ugly removal of spaces, done on the XML before it is parsed so that
+    # it matches the same text as always
     configXMLString = self.getXMLContents()
-    # ugly removal of spaces because minidom cannot remove them automatically when removing a node
-    configXMLString = re.sub('          <uam_dir>', '<uam_dir>', configXMLString)
-    configXMLString = re.sub('</uam_dir>\n', '</uam_dir>', configXMLString)
-
-    doc = xml.dom.minidom.parseString(configXMLString)
+    xmlString = re.sub('          <uam_dir>', '<uam_dir>', configXMLString)
+    xmlString = re.sub('</uam_dir>\n', '</uam_dir>', xmlString)
+    if xmlString == configXMLString:
+      doc = self._getDoc()
+    else:
+      doc = etree.fromstring(xmlString, _XML_PARSER)
+    # The nodes below are rewritten in what minidom would have written for
+    # the whole document, which leaves the cached tree alone
+    parts = _minidomParts(doc)
     # Remove <uam_dir> node because new GSAs expect so
-    uamdirNode = doc.getElementsByTagName("uam_dir").item(0)
-    uamdirNode.parentNode.removeChild(uamdirNode)
-
-    uardataNode = doc.getElementsByTagName("uar_data").item(0)
-    uardataB64contents = uardataNode.firstChild.nodeValue.strip()+'\n'
+    start, end = _elementSpan(parts, "uam_dir")
+    del parts[start:end]
+
+    start, end = _elementSpan(parts, "uar_data")
+    # Only the first text or CDATA node in <uar_data> is hashed and replaced
+    firstChild = end - start > 2 and parts[start + 1] or ""
+    if firstChild.startswith("<![CDATA["):
+      uardataContents = firstChild[len("<![CDATA["):-len("]]>")]
+    elif not firstChild.startswith("<"):
+      uardataContents = xml.sax.saxutils.unescape(firstChild, {"&quot;": '"'})
+    else:
+      uardataContents = ""
+    uardataB64contents = uardataContents.decode("utf-8").strip().encode("utf-8")+'\n'
     if uardataB64contents != "\n":
       log.debug("UAR data contains data.  Must be 7.0 or newer")
       # replace <uar_data> node with "/tmp/tmp_uar_data_dir,hash"
       # 1: Strip additional spaces at the end but we need the new line
       #     to compute hash.
       #    "AAAAAAAAAA==\n          ]]></uar_data>" <-- 10 spaces
-      uardataHash = hmac.new(password, uardataB64contents, hashlib.sha1).hexdigest()
+      uardataHmac = passwordHmac.copy()
+      uardataHmac.update(uardataB64contents)
+      uardataHash = uardataHmac.hexdigest()
       # 2: Replace to <dummy file name, hash> with additional whitespaces.
-      uardataNode.firstChild.nodeValue = ("\n/tmp/tmp_uar_data_dir,"
-          + "%s\n          ") % (''+uardataHash)
-      log.debug("uar_data is replaced to %s" % uardataNode.toxml())
-    # Get <config> node
-    configNode = doc.getElementsByTagName("config").item(0)
-    # get string of Node and children (as utf-8)
-    configNodeXML = configNode.toxml()
+      uardataContents = ("\n/tmp/tmp_uar_data_dir," + "%s\n          ") % (''+uardataHash)
+      if firstChild.startswith("<![CDATA["):
+        parts[start + 1] = "<![CDATA[%s]]>" % uardataContents
+      else:
+        parts[start + 1] = uardataContents
+      log.debug("uar_data is replaced to %s", _joinMinidomParts(parts[start:end]))
+    # get string of <config> node and children (as utf-8)
+    start, end = _elementSpan(parts, "config")
+    configNodeXML = _joinMinidomParts(parts[start:end])
     # Create new HMAC using user password and configXML as sum contents
-    return hmac.new(password, configNodeXML, hashlib.sha1).hexdigest()
+    configHmac = passwordHmac.copy()
+    configHmac.update(configNodeXML)
+    return configHmac.hexdigest()
 
   def sign(self, password):
     computedSignature=self.computeSignature(password)
-    configXMLString = self.getXMLContents()
-    doc = xml.dom.minidom.parseString(configXMLString)
+    doc = self._getDoc()
 
     # Get <signature> node
-    signatureNode = doc.getElementsByTagName("signature").item(0)
-    signatureCDATANode = signatureNode.firstChild
-    # Set CDATA/Text area to new HMAC
-    signatureCDATANode.nodeValue = computedSignature
-    self.setXMLContents(doc.toxml())
+    signatureNode = doc.find(".//signature")
+    # Set CDATA area to new HMAC
+    signatureNode.text = etree.CDATA(computedSignature)
+    # Not setXMLContents(): the cached tree already holds the new contents
+    self.configXMLString = etree.tostring(doc.getroottree(), encoding="utf-8",
+                                          xml_declaration=True)
 
   def writeFile(self, filename):
     if os.path.exists(filename):
       log.error("Output file exists")
       sys.exit(1)
-    doc = xml.dom.minidom.parseString(self.configXMLString)
-    outputXMLFile = codecs.open(filename, 'w', "utf-8")
-    log.debug("Writing XML to %s" % filename)
+    doc = self._getDoc()
+    outputXMLFile = open(filename, 'wb')
+    log.debug("Writing XML to %s", filename)
     # GSA newer than 6.? expects '<eef>' to be on the second line.
-    outputXMLFile.write(doc.toxml().replace("<eef>", "\n<eef>", 1))
+    # libxml2 always ends the XML declaration with a newline, so it is.
+    outputXMLFile.write(etree.tostring(doc.getroottree(), encoding="utf-8",
+                                       xml_declaration=True))
+    outputXMLFile.close()
 
   def verifySignature(self, password):
     computedSignature = self.computeSignature(password)
-    configXMLString = self.getXMLContents()
-    doc = xml.dom.minidom.parseString(configXMLString)
+    doc = self._getDoc()
 
     # Get <signature> node
-    signatureNode = doc.getElementsByTagName("signature").item(0)
-    signatureCDATANode = signatureNode.firstChild
-    signatureValue = signatureNode.firstChild.nodeValue
+    signatureNode = doc.find(".//signature")
+    signatureValue = signatureNode.text or ""
     # signatureValue may contain whitespace and linefeeds so we'll just ensure that
     # our HMAC is found within
 
-    if signatureValue.count(computedSignature) :
+    if computedSignature in signatureValue:
       log.debug("Signature matches")
       return 1
     else:
-      log.debug("Signature does not match %s vs %s" %
-                (signatureValue, computedSignature))
+      log.debug("Signature does not match %s vs %s",
+                signatureValue, computedSignature)
       return None
 
 
@@ -207,127 +448,178 @@ class gsaWebInterface:
   password = None
   hostName = None
   loggedIn = None
-  _url_opener = None
+  _session = None
+  _loginLock = None
+  # security_token values by actionType, valid for the current login
+  _securityTokens = None
 
   def __init__(self, hostName, username, password, port=8000):
+    _importRequests()
     self.baseURL = 'http://%s:%s/EnterpriseController' % (hostName, port)
     self.hostName = hostName
     self.username = username
     self.password = password
-    # build cookie jar for this web instance only. Should allow for GSAs port mapped behind a reverse proxy.
-    cookieJar = cookielib.CookieJar()
-    self._url_opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cookieJar))
-
-  def _openurl(self, request):
+    # Session with its own cookie jar for this web instance only. Should allow for GSAs
+    # port mapped behind a reverse proxy. Connections to the GSA are kept alive and
+    # reused across requests instead of doing a new TCP handshake each time.
+    self._session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    self._session.mount('http://%s:%s/' % (hostName, port), adapter)
+    self._securityTokens = {}
+    # Actions run from several threads share the login
+    self._loginLock = threading.Lock()
+
+  def _openurl(self, url, data=None, **kwargs):
     """Args:
-      request: urllib2 request object or URL string.
-    """
-    return self._url_opener.open(request)
+      url: URL string.
+      data: a dict or string to POST. The request is a GET if neither data
+        nor files are given.
+      kwargs: passed on to requests, e.g. params, files or headers.
 
-  def _encode_multipart_formdata(self, fields, files):
+    Returns:
+      A requests.Response, with loggedOut set if the GSA no longer considers
+      us logged in. Raises requests.HTTPError for 4xx/5xx responses.
     """
-    fields: a sequence of (name, value) elements for regular form fields.
-    files: a sequence of (name, filename, value) elements for data to be uploaded as files
+    if data is None and 'files' not in kwargs:
+      response = self._session.get(url, **kwargs)
+    else:
+      response = self._session.post(url, data, **kwargs)
+    # An expired admin console session is usually answered with the login
+    # page, directly or through a redirect, rather than a 401/403
+    if response.status_code in (401, 403):
+      response.loggedOut = True
+    elif kwargs.get('stream') and not (
+        response.history and 'html' in response.headers.get('Content-Type', '')):
+      # Don't read a download early unless it was redirected to some page
+      response.loggedOut = False
+    else:
+      response.loggedOut = bool(_LOGIN_FORM_PATTERN.search(response.content))
+    if response.loggedOut:
+      # Session expired or tokens rejected: log in and fetch them again next time
+      log.debug("Not logged in any more, answered by %s", response.url)
+      self._securityTokens.clear()
+      self.loggedIn = False
+    response.raise_for_status()
+    return response
+
+  def _openurlWithToken(self, actionType, request):
+    """Submit an Admin Console form that needs the security_token for actionType.
+
+    If the session has expired, log in again and resubmit the form once with
+    a fresh token.
+
+    Args:
+      actionType: a string, the form the security_token is fetched from.
+      request: a function taking the security_token and returning the
+        (url, data, kwargs) to call _openurl with.
+
+    Returns:
+      A requests.Response.
     """
-    BOUNDARY = '----------ThIs_Is_tHe_bouNdaRY_$'
-    CRLF = '\r\n'
-    lines = []
-    for (key, value) in fields:
-      lines.append('--' + BOUNDARY)
-      lines.append('Content-Disposition: form-data; name="%s"' % key)
-      lines.append('')
-      lines.append(value)
-    for (key, filename, value) in files:
-      lines.append('--' + BOUNDARY)
-      lines.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (key, filename))
-      lines.append('Content-Type: text/xml')
-      lines.append('')
-      lines.append(value)
-    lines.append('--' + BOUNDARY + '--')
-    lines.append('')
-    body = CRLF.join(lines)
-    content_type = 'multipart/form-data; boundary=%s' % BOUNDARY
-    return content_type, body
+    for attempt in range(2):
+      url, data, kwargs = request(self.getSecurityToken(actionType))
+      try:
+        response = self._openurl(url, data, **kwargs)
+      except requests.HTTPError, e:
+        if attempt or e.response.status_code not in (401, 403):
+          raise
+        continue
+      if not response.loggedOut:
+        return response
+      log.info("Session expired, logging in again")
+    log.error("Still not logged in after logging in again")
+    sys.exit(2)
 
   def _login(self):
-    if not self.loggedIn:
-      log.debug("Fetching initial page for new cookie")
-      self._openurl(self.baseURL)
-      request = urllib2.Request(self.baseURL,
-                                urllib.urlencode(
-          {'actionType' : 'authenticateUser',
-           # for 7.0 or older
-           'userName' : self.username,
-           'password' : self.password,
-           # for 7.2 and newer.  Having both doesn't hurt
-           'reqObj' : json.dumps([None, self.username, self.password, None, 1]),
-           }))
-
-      log.debug("Logging in as %s..."  % self.username)
-      result = self._openurl(request)
-      resultString = result.read()
-      # Pre 7.2 has "Google Search Appliance  &gt;Home"
-      # 7.2 and later returns JSON like object
-      home = re.compile("Google Search Appliance\s*&gt;\s*Home")
-      home72 = re.compile('"xsrf": \[null,"security_token","')
-      if  home.search(resultString):
-        log.debug("7.0 or older")
-        self.is72 = False
-      elif home72.search(resultString):
-        log.debug("7.2 or newer")
-        # The first line is junk to prevent some action on browsers:  )]}',
-        # Just skip it.
-        response = json.loads(resultString[5:])
-        log.info("Security token is: " + response["xsrf"][2])
-        self.is72 = True
-      else:
-        log.error("Login failed: " + resultString)
-        sys.exit(2)
+    with self._loginLock:
+      if not self.loggedIn:
+        self._securityTokens.clear()
+        log.debug("Fetching initial page for new cookie")
+        self._openurl(self.baseURL)
+        param = {'actionType' : 'authenticateUser',
+                 # for 7.0 or older
+                 'userName' : self.username,
+                 'password' : self.password,
+                 # for 7.2 and newer.  Having both doesn't hurt
+                 'reqObj' : json.dumps([None, self.username, self.password, None, 1]),
+                 }
+
+        log.debug("Logging in as %s...", self.username)
+        result = self._openurl(self.baseURL, param)
+        resultString = result.content
+        if _HOME_PATTERN.search(resultString):
+          log.debug("7.0 or older")
+          self.is72 = False
+        elif _HOME72_PATTERN.search(resultString):
+          log.debug("7.2 or newer")
+          # The first line is junk to prevent some action on browsers:  )]}',
+          # Just skip it.
+          response = json.loads(resultString[5:])
+          log.info("Security token is: %s", response["xsrf"][2])
+          self.is72 = True
+        else:
+          log.error("Login failed: %s", resultString)
+          sys.exit(2)
 
-      log.debug("Successfully logged in")
-      self.loggedIn = True
+        log.debug("Successfully logged in")
+        self.loggedIn = True
 
   def _logout(self):
-    request = urllib2.Request(self.baseURL + "?" + urllib.urlencode({'actionType' : 'logout'}))
-    self._openurl(request)
+    self._openurl(self.baseURL + "?" + urllib.urlencode({'actionType' : 'logout'}))
     self.loggedIn = False
+    self._securityTokens.clear()
+
+  def close(self):
+    "Logs out if logged in and closes the connections to the GSA"
+    if self.loggedIn:
+      try:
+        self._logout()
+      except requests.RequestException, e:
+        log.debug("Unable to log out: %s", e)
+    self._session.close()
 
-  def __del__(self):
-    self._logout()
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
 
   def importConfig(self, gsaConfig, configPassword):
     fields = [("actionType", "importExport"), ("passwordIn", configPassword),
         ("import", " Import Configuration ")]
 
-    files = [("importFileName", "config.xml", gsaConfig.getXMLContents() )]
-    content_type, body = self._encode_multipart_formdata(fields,files)
-    headers = {'User-Agent': 'python-urllib2', 'Content-Type': content_type}
+    # requests encodes fields and files as multipart/form-data straight into the body
+    files = {"importFileName": ("config.xml", gsaConfig.getXMLContents(), "text/xml")}
+    headers = {'User-Agent': 'python-urllib2'}
 
     self._login()
-    security_token = self.getSecurityToken('cache')
-    request = urllib2.Request(self.baseURL + "?" +
-                              urllib.urlencode({'actionType': 'importExport',
-                                                'export': ' Import Configuration ',
-                                                'security_token' : security_token,
-                                                'a' : '1',
-                                                'passwordIn': configPassword}),
-                              body, headers)
+
+    def request(security_token):
+      url = self.baseURL + "?" + urllib.urlencode({'actionType': 'importExport',
+                                                   'export': ' Import Configuration ',
+                                                   'security_token' : security_token,
+                                                   'a' : '1',
+                                                   'passwordIn': configPassword})
+      return url, fields, {'files': files, 'headers': headers}
+
     log.info("Sending XML...")
-    result = self._openurl(request)
-    content = result.read()
-    if content.count("Invalid file"):
+    result = self._openurlWithToken('cache', request)
+    content = result.content
+    # Collect the messages in one scan; they are checked in order of precedence below
+    messages = set(_IMPORT_RESULT_PATTERN.findall(content))
+    if "Invalid file" in messages:
       log.error("Invalid configuration file")
       sys.exit(2)
-    elif content.count("Wrong passphrase or the file is corrupt"):
+    elif "Wrong passphrase or the file is corrupt" in messages:
       log.error("Wrong passphrase or the file is corrupt. Try ")
       sys.exit(2)
-    elif content.count("Passphrase should be at least 8 characters long"):
+    elif "Passphrase should be at least 8 characters long" in messages:
       log.error("Passphrase should be at least 8 characters long")
       sys.exit(2)
-    elif content.count("File does not exist"):
+    elif "File does not exist" in messages:
       log.error("Configuration file does not exist")
       sys.exit(2)
-    elif not content.count("Configuration imported successfully"):
+    elif "Configuration imported successfully" not in messages:
       log.error("Import failed")
       sys.exit(2)
     else:
@@ -335,41 +627,45 @@ class gsaWebInterface:
 
   def exportConfig(self, configPassword):
     self._login()
-    security_token = self.getSecurityToken('cache')
-    request = urllib2.Request(self.baseURL + "?" +
-                              urllib.urlencode({'actionType': 'importExport',
-                                                'export': ' Export Configuration ',
-                                                'security_token': security_token,
-                                                'a': '1',
-                                                'password1': configPassword,
-                                                'password2': configPassword}))
+
+    def request(security_token):
+      url = self.baseURL + "?" + urllib.urlencode({'actionType': 'importExport',
+                                                   'export': ' Export Configuration ',
+                                                   'security_token': security_token,
+                                                   'a': '1',
+                                                   'password1': configPassword,
+                                                   'password2': configPassword})
+      return url, None, {}
 
     log.debug("Fetching config XML")
-    result = self._openurl(request)
-    content = result.read()
-    if content.count("Passphrase should be at least 8 characters long"):
-      log.error("Passphrase should be at least 8 characters long. You entered: '%s'" % (configPassword))
+    result = self._openurlWithToken('cache', request)
+    content = result.content
+    if "Passphrase should be at least 8 characters long" in content:
+      log.error("Passphrase should be at least 8 characters long. You entered: '%s'", configPassword)
       sys.exit(2)
     gsac = gsaConfig()
     log.debug("Returning gsaConfig object")
     gsac.setXMLContents(content)
     return gsac
 
-  def getSecurityTokenFromContents(self, content):
+  def getSecurityTokenFromContents(self, content, actionType=None):
     """Gets the value of the security_token hidden form parameter.
 
     Args:
       content: a string containing HTML contents
+      actionType: a string, if given the token found is remembered as the
+        current one for this Admin Console form.
 
     Returns:
       A long string, required as a parameter when submitting the form.
       Returns an empty string if security_token does not exist.
     """
-    token_re = re.compile('name="security_token"[^>]*value="([^"]*)"', re.I)
-    match = token_re.search(content)
+    match = _TOKEN_PATTERN.search(content)
     if match:
       security_token = match.group(1)
-      log.debug('Security token is: %s' % (security_token))
+      log.debug('Security token is: %s', security_token)
+      if actionType:
+        self._securityTokens[actionType] = security_token
       return security_token
     else:
       return ""
@@ -377,6 +673,9 @@ class gsaWebInterface:
   def getSecurityToken(self, actionType):
     """Gets the value of the security_token hidden form parameter.
 
+    The form is only fetched the first time a token for actionType is needed
+    after logging in.
+
     Args:
       actionType: a string, used to fetch the Admin Console form.
 
@@ -385,25 +684,18 @@ class gsaWebInterface:
       Returns an empty string if security_token does not exist.
     """
     self._login()
+    if actionType in self._securityTokens:
+      return self._securityTokens[actionType]
     # request needs to be a GET not POST
     url = "%s?actionType=%s&a=1" % (self.baseURL, actionType)
-    log.debug('Fetching url: %s' % (url))
+    log.debug('Fetching url: %s', url)
     result = self._openurl(url)
-    content = result.read()
-    token_re = re.compile('name="security_token"[^>]*value="([^"]*)"', re.I)
-    match = token_re.search(content)
-    if match:
-      security_token = match.group(1)
-      log.debug('Security token is: %s' % (security_token))
-      return security_token
-    else:
-      return ""
+    return self.getSecurityTokenFromContents(result.content, actionType)
 
   def setAccessControl(self, maxhostload=10, urlCacheTimeout=3600):
     # Tested on 6.8. Will not work on previous versions unless the form
     # parameters are modified.
     self._login()
-    security_token = self.getSecurityToken('cache')
     # Sample body of a POST from a 6.8 machine:
     #  security_token=Vaup237Rd5jXE6ZC0Iy6BeVo4h0%3A1290533850660&
     #  actionType=cache&
@@ -415,22 +707,23 @@ class gsaWebInterface:
     #  maxHostload=10&
     #  urlCacheTimeout=3600&
     #  saveSettings=Save+Settings
-    request = urllib2.Request(self.baseURL,
-                              urllib.urlencode({'security_token': security_token,
-                                                'a': '1',
-                                                'actionType': 'cache',
-                                                'basicAuthChallengeType': 'auto',
-                                                'authzServiceUrl': '',
-                                                'queryProcessingTime': '20.0',
-                                                'requestBatchTimeout': '5.0',
-                                                'singleRequestTimeout': '2.5',
-                                                'maxHostload': maxhostload,
-                                                'urlCacheTimeout': urlCacheTimeout,
-                                                'saveSettings': 'Save Settings'}))
-    result = self._openurl(request)
+    def request(security_token):
+      return self.baseURL, {'security_token': security_token,
+                            'a': '1',
+                            'actionType': 'cache',
+                            'basicAuthChallengeType': 'auto',
+                            'authzServiceUrl': '',
+                            'queryProcessingTime': '20.0',
+                            'requestBatchTimeout': '5.0',
+                            'singleRequestTimeout': '2.5',
+                            'maxHostload': maxhostload,
+                            'urlCacheTimeout': urlCacheTimeout,
+                            'saveSettings': 'Save Settings'}, {}
+
+    result = self._openurlWithToken('cache', request)
     # Form submit did not work if content contains this string: "Forgot Your Password" or
     # <font color="red"> unless multiple users are logged in.
-    # content = result.read()
+    # content = result.content
     # log.info(content)
 
   def _unescape(self, s):
@@ -444,15 +737,18 @@ class gsaWebInterface:
       database_list: a List of String, a list of database name to sync
     """
     self._login()
-    for database in database_list:
-      log.info("Syncing %s ..." % database)
-      param = urllib.urlencode({"actionType": "syncDatabase",
-                                "entryName": database})
-      request = urllib2.Request(self.baseURL + "?" + param)
+    # Only the database name changes from one request to the next
+    syncURL = "%s?%s&entryName=" % (self.baseURL,
+                                    urllib.urlencode({"actionType": "syncDatabase"}))
+
+    def sync(database):
+      log.info("Syncing %s ...", database)
       try:
-        result = self._openurl(request)
+        result = self._openurl(syncURL + urllib.quote_plus(database))
       except:
-        log.error("Unable to sync %s properly" % database)
+        log.error("Unable to sync %s properly", database)
+
+    _mapConcurrently(sync, database_list, _FANOUT_WORKERS)
 
   def exportAllUrls(self, out):
     """Export the list of all URLs
@@ -461,68 +757,72 @@ class gsaWebInterface:
       out: a File, the file to write to.
     """
     self._login()
-    security_token = self.getSecurityToken('exportAllUrls')
     log.info("Generating the list of all URLs")
-    if self.is72:
-      param = urllib.urlencode({'security_token' : security_token,
-                                'a'              : '1',
-                                'filterMode'     : 'all_urls',
-                                'goodURLs'       : '',
-                                'actionType'     : 'exportAllUrls',
-                                'exportAction'   : 'generate',
-                                'generate'       : 'Generate the gzip file',
-                                })
-    else:
-      param = urllib.urlencode({'actionType' : 'exportAllUrls',
-                                'action' : 'generate',
-                                'goodURLs' : '',
-                                'security_token' : security_token,
-                                'filterMode' : 'all_urls'})
-    request = urllib2.Request(self.baseURL, param)
 
+    def request(security_token):
+      if self.is72:
+        param = {'security_token' : security_token,
+                 'a'              : '1',
+                 'filterMode'     : 'all_urls',
+                 'goodURLs'       : '',
+                 'actionType'     : 'exportAllUrls',
+                 'exportAction'   : 'generate',
+                 'generate'       : 'Generate the gzip file',
+                 }
+      else:
+        param = {'actionType' : 'exportAllUrls',
+                 'action' : 'generate',
+                 'goodURLs' : '',
+                 'security_token' : security_token,
+                 'filterMode' : 'all_urls'}
+      return self.baseURL, param, {}
+
+    security_token = ''
     try:
-      result = self._openurl(request)
-      seurity_token = self.getSecurityTokenFromContents(result.read())
-      #output = result.read()
+      result = self._openurlWithToken('exportAllUrls', request)
+      security_token = self.getSecurityTokenFromContents(result.content, 'exportAllUrls')
+      #output = result.content
       #out.write(output)
     except Exception, e:
       log.error("Unable to generate the list of All URLs")
       log.error(e)
+    security_token = security_token or self.getSecurityToken('exportAllUrls')
 
+    if self.is72:
+      generating_msg = '<input type="submit" name="generate" id="generate" disabled class="hb-r-N nd-Ld-re" value="Generating...">'
+    else:
+      generating_msg = '<input type="submit" name="generate" id="generate" disabled value="Generating...">'
+    # Back off exponentially so that small lists are picked up within a second or two
+    delay = 1
     while 1:
-      param = urllib.urlencode({'actionType' : 'exportAllUrls',
-                                'security_token' : security_token,
-                                'a' : '1'})
-      request = urllib2.Request(self.baseURL, param)
-      result = self._openurl(request)
-      if self.is72:
-        generating_msg = '<input type="submit" name="generate" id="generate" disabled class="hb-r-N nd-Ld-re" value="Generating...">'
-      else:
-        generating_msg = '<input type="submit" name="generate" id="generate" disabled value="Generating...">'
-      content = result.read()
-      security_token = self.getSecurityTokenFromContents(content)
-      if content.find(generating_msg) == -1:
+      param = {'actionType' : 'exportAllUrls',
+               'security_token' : security_token,
+               'a' : '1'}
+      result = self._openurl(self.baseURL, param)
+      content = result.content
+      security_token = self.getSecurityTokenFromContents(content, 'exportAllUrls')
+      if generating_msg not in content:
         log.info("The list has been generated.")
-        log.debug("content is " + content)
+        log.debug("content is %s", content)
         break
       else:
-        log.info("Still generating the list.  Sleep for 10 seconds...")
-        time.sleep(10)
+        log.info("Still generating the list.  Sleep for %d seconds...", delay)
+        time.sleep(delay)
+        delay = min(delay * 2, 30)
 
     # 7.0 or older default
     exportActionStr = 'action'
     if self.is72:
       exportActionStr = 'exportAction'
     log.info("Downloading the list of all URLs")
-    param = urllib.urlencode({'actionType' : 'exportAllUrls',
-                              exportActionStr : 'download',
-                              'security_token' : security_token,
-                              'a' : '1'})
-    request = urllib2.Request(self.baseURL, param)
+    param = {'actionType' : 'exportAllUrls',
+             exportActionStr : 'download',
+             'security_token' : security_token,
+             'a' : '1'}
     try:
-      result = self._openurl(request)
-      output = result.read()
-      out.write(output)
+      result = self._openurl(self.baseURL, param, stream=True)
+      for chunk in result.iter_content(_DOWNLOAD_CHUNK_SIZE):
+        out.write(chunk)
     except Exception, e:
       log.error("Unable to download the list")
       log.error(e)
@@ -535,24 +835,25 @@ class gsaWebInterface:
       out: a File, the file to write to.
     """
     self._login()
-    security_token = self.getSecurityToken('viewFrontends')
-    log.info("Retrieving the keymatch file for %s" % frontend)
-    param = urllib.urlencode({'actionType' : 'frontKeymatchImport',
-                              'security_token' : security_token,
-                              'a' : '1',
-                              'frontend' : frontend,
-                              'frontKeymatchExportNow': 'Export KeyMatches Now',
-                              'startRow' : '1', 'search' : ''})
-    if self.is72:
-      request = urllib2.Request(self.baseURL, param)
-    else:
-      request = urllib2.Request(self.baseURL + "?" + param)
+    log.info("Retrieving the keymatch file for %s", frontend)
+
+    def request(security_token):
+      param = {'actionType' : 'frontKeymatchImport',
+               'security_token' : security_token,
+               'a' : '1',
+               'frontend' : frontend,
+               'frontKeymatchExportNow': 'Export KeyMatches Now',
+               'startRow' : '1', 'search' : ''}
+      if self.is72:
+        return self.baseURL, param, {'stream': True}
+      return self.baseURL, None, {'params': param, 'stream': True}
+
     try:
-      result = self._openurl(request)
-      output = result.read()
-      out.write(output)
+      result = self._openurlWithToken('viewFrontends', request)
+      for chunk in result.iter_content(_DOWNLOAD_CHUNK_SIZE):
+        out.write(chunk)
     except Exception, e:
-      log.error("Unable to retrieve Keymatches for %s" % frontend)
+      log.error("Unable to retrieve Keymatches for %s", frontend)
       log.error(e)
   def exportSynonyms(self, frontend, out):
     """Export all Related Queries for a frontend.
@@ -562,24 +863,25 @@ class gsaWebInterface:
       out: a File, the file to write to.
     """
     self._login()
-    security_token = self.getSecurityToken('viewFrontends')
-    log.info("Retrieving the Related Queries file for %s" % frontend)
-    param = urllib.urlencode({'actionType' : 'frontSynonymsImport',
-                              'security_token' : security_token,
-                              'a' : '1',
-                              'frontend' : frontend,
-                              'frontSynonymsExportNow': 'Export Related Queries Now',
-                              'startRow' : '1', 'search' : ''})
-    if self.is72:
-      request = urllib2.Request(self.baseURL, param)
-    else:
-      request = urllib2.Request(self.baseURL + "?" + param)
+    log.info("Retrieving the Related Queries file for %s", frontend)
+
+    def request(security_token):
+      param = {'actionType' : 'frontSynonymsImport',
+               'security_token' : security_token,
+               'a' : '1',
+               'frontend' : frontend,
+               'frontSynonymsExportNow': 'Export Related Queries Now',
+               'startRow' : '1', 'search' : ''}
+      if self.is72:
+        return self.baseURL, param, {'stream': True}
+      return self.baseURL, None, {'params': param, 'stream': True}
+
     try:
-      result = self._openurl(request)
-      output = result.read()
-      out.write(output)
+      result = self._openurlWithToken('viewFrontends', request)
+      for chunk in result.iter_content(_DOWNLOAD_CHUNK_SIZE):
+        out.write(chunk)
     except:
-      log.error("Unable to retrieve Related Queries for %s" % frontend)
+      log.error("Unable to retrieve Related Queries for %s", frontend)
 
   def getAllUrls(self, out):
     """Retrieve all the URLs in the Crawl Diagnostics.
@@ -595,61 +897,86 @@ class gsaWebInterface:
     """
     self._login()
     log.debug("Retrieving URLs from Crawl Diagostics")
-    tocrawl = set([self.baseURL + '?actionType=contentDiagnostics&sort=crawled'])
-    crawled = set([])
+    start = self.baseURL + '?actionType=contentDiagnostics&sort=crawled'
+    # Worker threads fetch the pages in tocrawl and hand them back through
+    # fetched.  This thread extracts the links of each page as soon as it
+    # arrives, queueing new pages while the other fetches carry on.
+    tocrawl = Queue.Queue()
+    fetched = Queue.Queue()
+    # Pages queued or crawled so far
+    seen = set([start])
     doc_urls = set([])
-    href_regex = re.compile(r'<a href="(.*?)"')
-    while 1:
-      try:
-        log.debug('have %i links to crawl' % len(tocrawl))
-        crawling = tocrawl.pop()
-        log.debug('crawling %s' % crawling)
-      except KeyError:
-        raise StopIteration
-      url = urlparse.urlparse(crawling)
-      request = urllib2.Request(crawling)
-      try:
-        result = self._openurl(request)
-      except:
-        print 'unable to open url'
-        continue
-      content = result.read()
-      crawled.add(crawling)
-
-      links = href_regex.findall(content)
-      log.debug('found %i links' % len(links))
-      for link in (links.pop(0) for _ in xrange(len(links))):
-        log.debug('found a link: %s' % link)
-        if link.startswith('/'):
-          link = url[0] + '://' + url[1] + link
-          link = self._unescape(link)
-          if link not in crawled:
-            log.debug('this links has not been crawled')
-            if (link.find('actionType=contentDiagnostics') != -1 and
-                 link.find('sort=excluded') == -1 and
-                 link.find('sort=errors') == -1 and
-                 link.find('view=excluded') == -1 and
-                 link.find('view=successful') == -1 and
-                 link.find('view=errors') == -1):
-              tocrawl.add(link)
-              #print 'add this link to my tocrawl list'
-            elif link.find('actionType=contentStatus') != -1:
-              # extract the document URL
-              doc_url = ''.join(cgi.parse_qs(urlparse.urlsplit(link)[3])['uriAt'])
-              if doc_url not in doc_urls:
-                out.write(doc_url + '\n')
-                doc_urls.add(doc_url)
-                if len(doc_urls) % 100 == 0:
-                  print len(doc_urls)
+
+    def worker():
+      while True:
+        crawling = tocrawl.get()
+        if crawling is None:
+          return
+        log.debug('crawling %s', crawling)
+        try:
+          content = self._openurl(crawling).content
+        except:
+          print 'unable to open url'
+          content = None
+        fetched.put((crawling, content))
+
+    threads = [threading.Thread(target=worker) for i in range(_CRAWL_WORKERS)]
+    for t in threads:
+      t.daemon = True
+      t.start()
+    tocrawl.put(start)
+    outstanding = 1
+    try:
+      while outstanding:
+        # A get without a timeout can't be interrupted by Ctrl-C on Python 2
+        try:
+          crawling, content = fetched.get(True, 0.5)
+        except Queue.Empty:
+          continue
+        outstanding -= 1
+        log.debug('have %i links to crawl', outstanding)
+        if content is None:
+          # Not crawled after all: try again if another page links to it
+          seen.discard(crawling)
+          continue
+        url = urlparse.urlparse(crawling)
+        links = _HREF_PATTERN.findall(content)
+        # Only the links are kept, not the page
+        del content
+        log.debug('found %i links', len(links))
+        for link in links:
+          log.debug('found a link: %s', link)
+          if link.startswith('/'):
+            link = url[0] + '://' + url[1] + link
+            link = self._unescape(link)
+            if link not in seen:
+              log.debug('this links has not been crawled')
+              if _DIAGNOSTICS_LINK_PATTERN.match(link):
+                seen.add(link)
+                tocrawl.put(link)
+                outstanding += 1
+                #print 'add this link to my tocrawl list'
+              elif _CONTENT_STATUS_LINK_PATTERN.search(link):
+                # extract the document URL
+                doc_url = ''.join(cgi.parse_qs(urlparse.urlsplit(link)[3])['uriAt'])
+                if doc_url not in doc_urls:
+                  out.write(doc_url + '\n')
+                  doc_urls.add(doc_url)
+                  if len(doc_urls) % 100 == 0:
+                    print len(doc_urls)
+              else:
+                log.debug('we are not going to crawl this link %s', link)
+                pass
             else:
-              log.debug('we are not going to crawl this link %s' % link)
+              log.debug('already crawled %s', link)
               pass
           else:
-            log.debug('already crawled %s' % link)
+            log.debug('we are not going to crawl this link %s', link)
             pass
-        else:
-          log.debug('we are not going to crawl this link %s' % link)
-          pass
+    finally:
+      # Stop the workers, whether the crawl finished or was interrupted
+      for t in threads:
+        tocrawl.put(None)
 
   def getStatus(self):
     """Get System Status and mirroring if enabled
@@ -660,23 +987,21 @@ class gsaWebInterface:
 
     self._login()
     log.info("Retrieving GSA^n network diagnostics status from: %s", self.hostName)
-    request = urllib2.Request(self.baseURL + "?" +
-                              urllib.urlencode({'a': 1,
-                                                'actionType': 'gsanDiagnostics'}))
-
-    result = self._openurl(request)
-    content = result.read()
-    nodes = re.findall("row.*(<b>.*</b>)", content)
+    result = self._openurl(self.baseURL + "?" +
+                           urllib.urlencode({'a': 1,
+                                             'actionType': 'gsanDiagnostics'}))
+    content = result.content
     if self.is72 and "nd-ue-re" in content:
       print "This is 7.2 or newer.  Just printing the whole output contents."
       print content
       return
+    nodes = _NODE_PATTERN.findall(content)
     if not nodes:
-      log.error("Could not find any replicas...\n%s" % content)
+      log.error("Could not find any replicas...\n%s", content)
       exit(3)
 
     log.debug(nodes)
-    connStatus = re.findall("(green|red) button", content)
+    connStatus = _CONN_STATUS_PATTERN.findall(content)
     log.debug(connStatus)
 
     numErrs = 0
@@ -690,7 +1015,7 @@ class gsaWebInterface:
     pos = 0
     print "========================================="
     for node in nodes:
-      print "Node: " +  re.sub(r'<[^<]*?/?>', '', node)
+      print "Node: " +  _TAG_PATTERN.sub('', node)
       print "Ping Status: " + connStatus[0+pos]
       print "Stunnel Listener up: ", connStatus[1+pos]
       print "Stunnel Connection: ", connStatus[2+pos]
@@ -706,12 +1031,12 @@ class gsaWebInterface:
       print "All Tests passes successfully"
     print "=========================================\n"
 
-    detailStats = re.search("Detailed Status(.*)\"Balls\">", content, re.DOTALL)
+    detailStats = _DETAILED_STATUS_PATTERN.search(content)
     if detailStats:
     #Check if this is primary node and display sync info
-      detailStats = re.sub(r'</td>\n<td ', ': <', detailStats.group(), re.DOTALL)
-      detailStats = re.sub(r'</td> <td ',' | <', detailStats, re.DOTALL)
-      detailStats = re.sub(r'<[^<]*?/?>', '', detailStats)
+      detailStats = _DETAILED_STATUS_MARKUP_PATTERN.sub(
+          lambda match: _CELL_SEPARATORS.get(match.group(1), ''),
+          detailStats.group())
 
       prettyStats = detailStats.split("\n")
       for row in prettyStats:
@@ -726,16 +1051,15 @@ class gsaWebInterface:
     self._login()
     log.debug("Retrieving GSA's collection information from: %s, collection name %s",
               self.hostName, collection)
-    request = urllib2.Request(self.baseURL + "?" +
-                              urllib.urlencode({'actionType': 'contentDiagnostics',
-                                                'sort': 'crawled',
-                                                'collection': collection}))
-    result = self._openurl(request)
-    content = result.read()
-    urlall = re.findall("view=all.>(.*)</a>",content)
-    urlsuccessful = re.findall("view=successful.>(.*)</a>",content)
-    urlerrors = re.findall("view=errors.>(.*)</a>",content)
-    urlexcluded = re.findall("view=excluded.>(.*)</a>",content)
+    result = self._openurl(self.baseURL + "?" +
+                           urllib.urlencode({'actionType': 'contentDiagnostics',
+                                             'sort': 'crawled',
+                                             'collection': collection}))
+    content = result.content
+    urlall = _URL_ALL_PATTERN.findall(content)
+    urlsuccessful = _URL_SUCCESSFUL_PATTERN.findall(content)
+    urlerrors = _URL_ERRORS_PATTERN.findall(content)
+    urlexcluded = _URL_EXCLUDED_PATTERN.findall(content)
     numsurls = 0
     numeurls = 0
     for i in range(len(urlall)):
@@ -756,69 +1080,299 @@ class gsaWebInterface:
     if not os.path.exists(sscript_file):
       log.error("File %s does not exist", sscript_file)
       sys.exit(1)
-    ssfd = open(sscript_file)
-    ss_str = ssfd.read()
-    ssfd.close()
-
     self._login()
-    security_token = self.getSecurityToken('cache')
-    fields = [('security_token', security_token),
-              ('actionType', 'supportScripts'),
-              ('action', 'run'),
-              ('scriptType', 'customFile'),
-              ('run', 'Run support script')]
-    files = [('importFileName', 'cus_sscript_file', ss_str)]
-    content_type, body = self._encode_multipart_formdata(fields,files)
-    headers = {'User-Agent': 'python-urllib2', 'Content-Type': content_type}
-    request = urllib2.Request(self.baseURL, body, headers)
+    headers = {'User-Agent': 'python-urllib2'}
     log.info("Submitting support script...")
-    result = self._openurl(request)
-    content = result.read()
-    if content.count("Support script submission failed"):
+    # Hand the open file to requests, which reads it while encoding the body
+    with open(sscript_file, 'rb') as ssfd:
+
+      def request(security_token):
+        fields = [('security_token', security_token),
+                  ('actionType', 'supportScripts'),
+                  ('action', 'run'),
+                  ('scriptType', 'customFile'),
+                  ('run', 'Run support script')]
+        # Start from the beginning again if the form is resubmitted
+        ssfd.seek(0)
+        files = {'importFileName': ('cus_sscript_file', ssfd, 'text/xml')}
+        return self.baseURL, fields, {'files': files, 'headers': headers}
+
+      result = self._openurlWithToken('cache', request)
+    content = result.content
+    if "Support script submission failed" in content:
       log.error("Support script submission failed")
       sys.exit(2)
     log.info("Support script submitted")
 
     # support script submitted, check whether output is available
     
-    param = urllib.urlencode({"actionType": "supportScripts"})
-    request = urllib2.Request(self.baseURL + "?" + param)
+    # Built once; every poll requests the same page
+    poll_url = self.baseURL + "?" + urllib.urlencode({"actionType": "supportScripts"})
     tm = 0
-    sleeptime = 4
+    # Back off between polls, with a little jitter, so long runs poll less often
+    sleeptime = 2.0
+    max_sleep = 60.0
+    base = 1.5
     while True:
-      result = self._openurl(request)
-      content = result.read()
-      if not content.count("A support script is running"):
+      # Read the whole page so the connection goes back to the pool for the next poll
+      content = self._openurl(poll_url).content
+      if "A support script is running" not in content:
         log.info("output is ready")
         break
-      log.info("Support script still running...")
-      time.sleep(sleeptime)
-      tm += sleeptime
-      if tm > timeout:
+      if tm >= timeout:
         log.error("Support script timed out")
         sys.exit(1)
+      log.info("Support script still running...")
+      # Never sleep past the timeout; the poll after the last sleep still counts
+      delay = min(sleeptime + random.uniform(0, sleeptime * 0.1), timeout - tm)
+      time.sleep(delay)
+      tm += delay
+      sleeptime = min(sleeptime * base, max_sleep)
 
     # support script run is done, download the output
-    param = urllib.urlencode({"actionType": "supportScripts",
-                              "security_token": security_token,
-                              "download": "Download results from previous run",
-                              "action": "download"})
-    request = urllib2.Request(self.baseURL, param)
-    result = self._openurl(request)
-    content = result.read()
-    if content.count("Unable to download results"):
-      log.error("Unable to download results")
-      sys.exit(1)
-    elif content.count("Error when trying to retrieve support script output"):
-      log.error("Error when trying to retrieve support script output")
+    def request(security_token):
+      return self.baseURL, {"actionType": "supportScripts",
+                            "security_token": security_token,
+                            "download": "Download results from previous run",
+                            "action": "download"}, {'stream': True}
+
+    result = self._openurlWithToken('cache', request)
+    chunks = result.iter_content(_DOWNLOAD_CHUNK_SIZE)
+    # Errors are reported in a short page, so checking the first chunk is enough
+    content = next(chunks, '')
+    error = _SSCRIPT_ERROR_PATTERN.search(content)
+    if error:
+      log.error(error.group())
       sys.exit(1)
 
     out_fd.write(content)
+    for chunk in chunks:
+      out_fd.write(chunk)
 
 ###############################################################################
 # MAIN
 ###############################################################################
 
+def _webInterface(options):
+  """Return a gsaWebInterface for the GSA given on the command line."""
+  return gsaWebInterface(options.gsaHostName, options.gsaUsername,
+                         options.gsaPassword, options.port)
+
+
+def _splitNames(value):
+  """Split a comma separated list of names, dropping any repeated ones."""
+  names = []
+  for name in value.split(","):
+    if name not in names:
+      names.append(name)
+  return names
+
+
+def _openOutputFile(options, fileName=None):
+  """Open fileName, by default the --output file, for writing.
+
+  Raises UsageError if no --output was given or the file cannot be opened.
+  """
+  if not options.outputFile:
+    raise UsageError("Output file not given")
+  fileName = fileName or options.outputFile
+  try:
+    return open(fileName, 'w')
+  except IOError:
+    raise UsageError("unable to open %s to write" % fileName)
+
+
+def _openFrontendOutputFiles(options):
+  """Return (frontend, file) pairs for the comma separated --frontend list.
+
+  A single frontend is written to the --output file.  With several, each one
+  gets its own file with the frontend name inserted before the extension,
+  e.g. keymatches.default_frontend.csv.
+  """
+  if not options.frontend:
+    raise UsageError("No frontend defined")
+  frontends = _splitNames(options.frontend)
+  if len(frontends) == 1:
+    return [(frontends[0], _openOutputFile(options))]
+  root, ext = os.path.splitext(options.outputFile or '')
+  return [(frontend, _openOutputFile(options, "%s.%s%s" % (root, frontend, ext)))
+          for frontend in frontends]
+
+
+def do_sign(options):
+  if not options.inputFile:
+    raise UsageError("Input file not given")
+
+  if not options.outputFile:
+    raise UsageError("Output file not given")
+
+  log.info("Signing %s", options.inputFile)
+  gsac = gsaConfig(options.inputFile)
+  gsac.sign(options.signpassword)
+  log.info("Writing signed file to %s", options.outputFile)
+  gsac.writeFile(options.outputFile)
+
+
+def do_import(options):
+  if not options.inputFile:
+    raise UsageError("Input file not given")
+  log.info("Importing %s to %s", options.inputFile, options.gsaHostName)
+  gsac = gsaConfig(options.inputFile)
+  if not gsac.verifySignature(options.signpassword):
+    log.warn("Pre-import validation failed. Signature does not match. Expect the GSA to fail on import")
+  with _webInterface(options) as gsaWI:
+    gsaWI.importConfig(gsac, options.signpassword)
+  log.info("Import completed")
+
+
+def do_export(options):
+  if not options.outputFile:
+    raise UsageError("Output file not given")
+  log.info("Exporting config from %s to %s", options.gsaHostName, options.outputFile)
+  with _webInterface(options) as gsaWI:
+    gsac = gsaWI.exportConfig(options.signpassword)
+  gsac.writeFile(options.outputFile)
+  log.info("Export completed")
+
+
+def do_verify(options):
+  if not options.inputFile:
+    raise UsageError("Input file not given")
+  gsac = gsaConfig(options.inputFile)
+  if gsac.verifySignature(options.signpassword):
+    log.info("XML Signature/HMAC matches supplied password" )
+  else:
+    log.warn("XML Signature/HMAC does NOT match supplied password" )
+    sys.exit(1)
+
+
+def do_setaccesscontrol(options):
+  log.info("Setting access control")
+  if options.maxhostload:
+    try:
+      maxhostload = int(options.maxhostload)
+      log.info("Value of max hostload: %d", maxhostload)
+    except ValueError:
+      raise UsageError("Max hostload is not an integer: %s" % options.maxhostload)
+
+  if options.maxhostload and options.timeout:
+    with _webInterface(options) as gsaWI:
+      gsaWI.setAccessControl(options.maxhostload, options.timeout)
+  elif options.maxhostload:
+    with _webInterface(options) as gsaWI:
+      gsaWI.setAccessControl(options.maxhostload)
+  else:
+    raise UsageError("No value for Authorization Cache Timeout or Max Host Load")
+
+
+def do_all_urls(options):
+  f = _openOutputFile(options)
+  log.info("Retrieving URLs in crawl diagnostics to %s", options.outputFile)
+  with _webInterface(options) as gsaWI:
+    gsaWI.getAllUrls(f)
+  f.close()
+  log.info("All URLs exported.")
+
+
+def do_export_all_urls(options):
+  f = _openOutputFile(options)
+  log.info("Exporting all URLs to %s", options.outputFile)
+  with _webInterface(options) as gsaWI:
+    gsaWI.exportAllUrls(f)
+  f.close()
+
+
+def do_database_sync(options):
+  if not options.sources:
+    raise UsageError("No sources to sync")
+  databases = _splitNames(options.sources)
+  log.info("Sync'ing databases %s", options.sources)
+  with _webInterface(options) as gsaWI:
+    gsaWI.syncDatabases(databases)
+  log.info("Sync completed")
+
+
+def do_keymatches_export(options):
+  outputs = _openFrontendOutputFiles(options)
+  for frontend, f in outputs:
+    log.info("Exporting keymatches for %s to %s", frontend, f.name)
+  with _webInterface(options) as gsaWI:
+    # Log in once here rather than once per thread if the password is wrong
+    gsaWI._login()
+    _mapConcurrently(lambda output: gsaWI.exportKeymatches(*output),
+                     outputs, _FANOUT_WORKERS)
+  for frontend, f in outputs:
+    f.close()
+
+
+def do_synonyms_export(options):
+  outputs = _openFrontendOutputFiles(options)
+  for frontend, f in outputs:
+    log.info("Exporting synonyms for %s to %s", frontend, f.name)
+  with _webInterface(options) as gsaWI:
+    # Log in once here rather than once per thread if the password is wrong
+    gsaWI._login()
+    _mapConcurrently(lambda output: gsaWI.exportSynonyms(*output),
+                     outputs, _FANOUT_WORKERS)
+  for frontend, f in outputs:
+    f.close()
+
+
+def do_status(options):
+  with _webInterface(options) as gsaWI:
+    gsaWI.getStatus()
+
+
+def do_getcollection(options):
+  if not options.collection:
+    collections = ["default_collection"]
+  else:
+    collections = _splitNames(options.collection)
+  with _webInterface(options) as gsaWI:
+    gsaWI._login()
+    _mapConcurrently(gsaWI.getCollection, collections, _FANOUT_WORKERS)
+
+
+def do_cus_sscript(options):
+  if not options.inputFile:
+    raise UsageError("Input file not given")
+  f = _openOutputFile(options)
+  with _webInterface(options) as gsaWI:
+    if options.timeout:
+      gsaWI.runCusSscript(options.inputFile, f, int(options.timeout))
+    else:
+      gsaWI.runCusSscript(options.inputFile, f)
+
+
+# (option dest, action) pairs, in the order the actions are listed in --help
+ACTIONS = [('actimport', 'import'),
+           ('setaccesscontrol', 'setaccesscontrol'),
+           ('export', 'export'),
+           ('sign', 'sign'),
+           ('verify', 'verify'),
+           ('all_urls', 'all_urls'),
+           ('export_all_urls', 'export_all_urls'),
+           ('database_sync', 'database_sync'),
+           ('keymatches_export', 'keymatches_export'),
+           ('synonyms_export', 'synonyms_export'),
+           ('getstatus', 'status'),
+           ('getcollection', 'getcollection'),
+           ('cus_sscript', 'cus_sscript')]
+
+HANDLERS = {'import': do_import,
+            'setaccesscontrol': do_setaccesscontrol,
+            'export': do_export,
+            'sign': do_sign,
+            'verify': do_verify,
+            'all_urls': do_all_urls,
+            'export_all_urls': do_export_all_urls,
+            'database_sync': do_database_sync,
+            'keymatches_export': do_keymatches_export,
+            'synonyms_export': do_synonyms_export,
+            'status': do_status,
+            'getcollection': do_getcollection,
+            'cus_sscript': do_cus_sscript}
+
 if __name__ == "__main__":
   log.setLevel(DEFAULTLOGLEVEL)
   logStreamHandler = logging.StreamHandler(sys.stdout)
@@ -847,10 +1401,10 @@ if __name__ == "__main__":
                     help="List of databases to sync (database1,database2,database3)")
 
   parser.add_option("--frontend", dest="frontend",
-                    help="Frontend used to export keymatches or related queries")
+                    help="Frontend(s) used to export keymatches or related queries (frontend1,frontend2)")
 
   parser.add_option("--collection", dest="collection",
-                    help="Collection name")
+                    help="Collection name(s) (collection1,collection2)")
 
   # actionsOptions
   actionOptionsGrp = OptionGroup(parser, "Actions:")
@@ -926,290 +1480,44 @@ if __name__ == "__main__":
     logLevel = startingLevel - logOffset
     log.setLevel(logLevel)
 
-  # Actions actimport, export, sign, & verify need signpassword
-  # if not options.setaccesscontrol:
-  if options.actimport or options.export or options.sign or options.verify:
-    # Verify opts
-    if not options.signpassword:
-      log.error("Signing password not given")
-      sys.exit(3)
+  try:
+    # Actions actimport, export, sign, & verify need signpassword
+    # if not options.setaccesscontrol:
+    if options.actimport or options.export or options.sign or options.verify:
+      # Verify opts
+      if not options.signpassword:
+        raise UsageError("Signing password not given")
 
-    if len(options.signpassword) < 8:
-      log.error("Signing password must be 8 characters or longer")
-      sys.exit(3)
+      if len(options.signpassword) < 8:
+        raise UsageError("Signing password must be 8 characters or longer")
 
-  if options.timeout:
-    try:
-      timeout = int(options.timeout)
-      log.info("Value of timeout: %d" % (timeout))
-    except ValueError:
-      log.error("Timeout is not an integer: %s" % (timeout))
-      sys.exit(3)
-
-  action = None
-
-  # Ensure only one action is specified
-  if options.actimport:
-    action = "import"
-  if options.setaccesscontrol:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "setaccesscontrol"
-  if options.export:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "export"
-  if options.sign:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "sign"
-  if options.verify:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "verify"
-  if options.all_urls:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "all_urls"
-  if options.export_all_urls:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action="export_all_urls"
-  if options.database_sync:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "database_sync"
-  if options.keymatches_export:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "keymatches_export"
-  if options.synonyms_export:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "synonyms_export"
-  if options.getstatus:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "status"
-  if options.getcollection:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "getcollection"
-  if options.cus_sscript:
-    if action:
-      log.error("Specify only one action")
-      sys.exit(3)
-    else:
-      action = "cus_sscript"
-  if not action:
-      log.error("No action specified")
-      sys.exit(3)
-
-
-  if action != "sign" or action != "verify":
-    #Check user, password, host
-    if not options.gsaHostName:
-      log.error("hostname not given")
-      sys.exit(3)
-    if not options.gsaUsername:
-      log.error("username not given")
-      sys.exit(3)
-    if not options.gsaPassword:
-      log.error("password not given")
-      sys.exit(3)
-
-  # Actions
-  if action == "sign":
-    if not options.inputFile:
-      log.error("Input file not given")
-      sys.exit(3)
-
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-
-    log.info("Signing %s" % options.inputFile)
-    gsac = gsaConfig(options.inputFile)
-    gsac.sign(options.signpassword)
-    log.info("Writing signed file to %s" % options.outputFile)
-    gsac.writeFile(options.outputFile)
-
-  elif action == "import":
-    if not options.inputFile:
-      log.error("Input file not given")
-      sys.exit(3)
-    log.info("Importing %s to %s" % (options.inputFile, options.gsaHostName) )
-    gsac = gsaConfig(options.inputFile)
-    if not gsac.verifySignature(options.signpassword):
-      log.warn("Pre-import validation failed. Signature does not match. Expect the GSA to fail on import")
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.importConfig(gsac, options.signpassword)
-    log.info("Import completed")
-
-  elif action == "export":
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    log.info("Exporting config from %s to %s" % (options.gsaHostName, options.outputFile) )
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsac = gsaWI.exportConfig(options.signpassword)
-    gsac.writeFile(options.outputFile)
-    log.info("Export completed")
-
-  elif action == "verify":
-    if not options.inputFile:
-      log.error("Input file not given")
-      sys.exit(3)
-    gsac = gsaConfig(options.inputFile)
-    if gsac.verifySignature(options.signpassword):
-      log.info("XML Signature/HMAC matches supplied password" )
-    else:
-      log.warn("XML Signature/HMAC does NOT match supplied password" )
-      sys.exit(1)
-
-  elif action == "setaccesscontrol":
-    log.info("Setting access control")
-    if options.maxhostload:
+    if options.timeout:
       try:
-        maxhostload = int(options.maxhostload)
-        log.info("Value of max hostload: %d" % (maxhostload))
+        timeout = int(options.timeout)
+        log.info("Value of timeout: %d", timeout)
       except ValueError:
-        log.error("Max hostload is not an integer: %s" % (maxhostload))
-        sys.exit(3)
-
-    if options.maxhostload and options.timeout:
-      gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-      gsaWI.setAccessControl(options.maxhostload, options.timeout)
-    elif options.maxhostload:
-      gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-      gsaWI.setAccessControl(options.maxhostload)
-    else:
-      log.error("No value for Authorization Cache Timeout or Max Host Load")
-      sys.exit(3)
-
-  elif action == "all_urls":
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    try:
-      f = open(options.outputFile, 'w')
-    except IOError:
-      log.error("unable to open %s to write" % options.outputFile)
-      sys.exit(3)
-    else:
-      log.info("Retrieving URLs in crawl diagnostics to %s" % options.outputFile)
-      gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-      gsaWI.getAllUrls(f)
-      f.close()
-      log.info("All URLs exported.")
-
-  elif action == "export_all_urls":
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    try:
-      f = open(options.outputFile, 'w')
-    except IOError:
-      log.error("unable to open %s to write" % options.outputFile)
-      sys.exit(3)
-
-    log.info("Exporting all URLs to %s" % options.outputFile)
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.exportAllUrls(f)
-    f.close()
-
-  elif action == "database_sync":
-    if not options.sources:
-      log.error("No sources to sync")
-      sys.exit(3)
-    databases = options.sources.split(",")
-    log.info("Sync'ing databases %s" % options.sources)
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsac = gsaWI.syncDatabases(databases)
-    log.info("Sync completed")
-
-  elif action == "keymatches_export":
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    if not options.frontend:
-      log.error("No frontend defined")
-      sys.exit(3)
-    try:
-      f = open(options.outputFile, 'w')
-    except IOError:
-      log.error("unable to open %s to write" % options.outputFile)
-      sys.exit(3)
-
-    log.info("Exporting keymatches for %s to %s" % (options.frontend, options.outputFile) )
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.exportKeymatches(options.frontend, f)
-    f.close()
-
-  elif action == "synonyms_export":
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    if not options.frontend:
-      log.error("No frontend defined")
-      sys.exit(3)
-    try:
-      f = open(options.outputFile, 'w')
-    except IOError:
-      log.error("unable to open %s to write" % options.outputFile)
-      sys.exit(3)
-
-    log.info("Exporting synonyms for %s to %s" % (options.frontend, options.outputFile) )
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.exportSynonyms(options.frontend, f)
-    f.close()
-  elif action == "status":
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.getStatus()
-  elif action == "getcollection":
-    if not options.collection:
-      collection = "default_collection"
-    else:
-      collection = options.collection
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    gsaWI.getCollection(collection)
-  elif action == "cus_sscript":
-    if not options.inputFile:
-      log.error("Input file not given")
-      sys.exit(3)
-    if not options.outputFile:
-      log.error("Output file not given")
-      sys.exit(3)
-    try:
-      f = open(options.outputFile, 'w')
-    except IOError:
-      log.error("unable to open %s to write" % options.outputFile)
-      sys.exit(3)
-
-    gsaWI = gsaWebInterface(options.gsaHostName, options.gsaUsername, options.gsaPassword)
-    if options.timeout:
-      gsaWI.runCusSscript(options.inputFile, f, timeout)
-    else:
-      gsaWI.runCusSscript(options.inputFile, f)
+        raise UsageError("Timeout is not an integer: %s" % options.timeout)
+
+    # Ensure exactly one action is specified
+    chosen = [a for f, a in ACTIONS if getattr(options, f, None)]
+    if not chosen:
+      raise UsageError("No action specified")
+    if len(chosen) > 1:
+      given = [option.get_opt_string() for option in actionOptionsGrp.option_list
+               if getattr(options, option.dest)]
+      raise UsageError("Specify only one action, got: %s" % " ".join(given))
+    action = chosen[0]
+
+    if action not in ("sign", "verify"):
+      #Check user, password, host
+      if not options.gsaHostName:
+        raise UsageError("hostname not given")
+      if not options.gsaUsername:
+        raise UsageError("username not given")
+      if not options.gsaPassword:
+        raise UsageError("password not given")
+
+    HANDLERS[action](options)
+  except UsageError, e:
+    log.error("%s", e)
+    sys.exit(e.code)
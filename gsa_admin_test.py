@@ -0,0 +1,192 @@
+#!/usr/bin/python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for gsa_admin.
+
+Only the actions that work on local files are tested, no GSA is needed.
+"""
+
+import hashlib
+import hmac
+import optparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+import xml.dom.minidom
+import gsa_admin
+
+
+CONFIG = """<?xml version="1.0" encoding="UTF-8"?>
+<eef>
+  <config Schema="2.0" EnterpriseVersion="7.2.0">
+    <globalparams>
+      <uam_dir>
+        <![CDATA[/tmp/uam]]>
+      </uam_dir>
+      <uar_data>
+        <![CDATA[
+dXNlcnMgYW5kIHJvbGVz
+          ]]>
+      </uar_data>
+      <param name="Hostload" value="4"/>
+    </globalparams>
+  </config>
+  <signature><![CDATA[0000]]></signature>
+</eef>
+"""
+
+
+def minidomSignature(configXMLString, password):
+  """gsaConfig.computeSignature() as it was done with xml.dom.minidom."""
+  configXMLString = re.sub('          <uam_dir>', '<uam_dir>', configXMLString)
+  configXMLString = re.sub('</uam_dir>\n', '</uam_dir>', configXMLString)
+  doc = xml.dom.minidom.parseString(configXMLString)
+  uamdirNode = doc.getElementsByTagName("uam_dir").item(0)
+  uamdirNode.parentNode.removeChild(uamdirNode)
+  uardataNode = doc.getElementsByTagName("uar_data").item(0)
+  uardataB64contents = uardataNode.firstChild.nodeValue.strip()+'\n'
+  if uardataB64contents != "\n":
+    uardataHash = hmac.new(password, uardataB64contents, hashlib.sha1).hexdigest()
+    uardataNode.firstChild.nodeValue = ("\n/tmp/tmp_uar_data_dir,"
+        + "%s\n          ") % (''+uardataHash)
+  configNode = doc.getElementsByTagName("config").item(0)
+  configNodeXML = configNode.toxml()
+  return hmac.new(password, configNodeXML, hashlib.sha1).hexdigest()
+
+
+class RandomConfig:
+  """Random configs with the markup the minidom signature was sensitive to."""
+
+  TEXT = ['"', "'", '&amp;', '&lt;', '&gt;', '&#13;', '&#10;', '&#9;', '\n',
+          '\t', ' ', '          ', 'x', 'caf\xc3\xa9', '&#13;&#10;', '>',
+          '&quot;', '&amp;#13;', '\xc2\xa0', 'AAAA==']
+  CDATA = ['<![CDATA[%s]]>' % data for data in
+           ['', '"q"', 'a\n"b"&<>', '&#13;', '\nAAAA==\n          ']]
+  TAGS = ['a', 'b', 'p:a', 'p:b']
+  ATTRIBUTES = ['z', 'y', 'p:x', 'q:w', 'xmlns:q', 'xmlns']
+  UAM_DIRS = ['          <uam_dir>d</uam_dir>\n', '<uam_dir>d</uam_dir>',
+              '   <uam_dir/>\n', '          <uam_dir z="1">\n</uam_dir>\n',
+              '\n          <uam_dir><![CDATA[d]]></uam_dir>\n          ']
+
+  def __init__(self, seed):
+    self.random = random.Random(seed)
+
+  def text(self):
+    return ''.join(self.random.choice(self.TEXT)
+                   for i in range(self.random.randint(0, 6)))
+
+  def attributes(self, exclude=()):
+    names = [name for name in self.ATTRIBUTES if name not in exclude]
+    names = self.random.sample(names, self.random.randint(0, 4))
+    return ''.join(' %s="%s"' % (name, name.startswith('xmlns') and 'urn:' + name
+                                 or self.text().replace('"', '&quot;'))
+                   for name in names)
+
+  def content(self, depth):
+    body = ''
+    for i in range(self.random.randint(0, 3)):
+      r = self.random.random()
+      if r < .4:
+        body += self.text()
+      elif r < .55:
+        body += self.random.choice(self.CDATA)
+      elif r < .6:
+        body += '<!-- c "x" -->'
+      elif r < .65:
+        body += '<?pi d="1"?>'
+      elif depth < 3:
+        body += self.element(depth + 1)
+    return body
+
+  def element(self, depth):
+    name = self.random.choice(self.TAGS)
+    attributes = self.attributes()
+    body = self.content(depth)
+    if not body and self.random.random() < .5:
+      return '<%s%s/>' % (name, attributes)
+    return '<%s%s>%s</%s>' % (name, attributes, body, name)
+
+  def uarData(self):
+    # minidom needs a first child; the GSA never exports an empty CDATA here
+    first = self.random.choice([self.random.choice(self.CDATA[1:]), self.text() or 'x'])
+    return '<uar_data>%s%s</uar_data>' % (first, self.content(3))
+
+  def config(self):
+    config = [self.element(1), self.uarData(), self.element(1)]
+    config.insert(self.random.randint(0, 3), self.random.choice(self.UAM_DIRS))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<eef xmlns:p="urn:p" xmlns:q="urn:q"%s>%s<config%s>%s</config>'
+            '<signature><![CDATA[0000]]></signature></eef>\n' % (
+                self.attributes(exclude=['xmlns:q']), self.content(2), self.attributes(),
+                ''.join(config)))
+
+
+class GsaAdminUnitTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.inputFile = os.path.join(self.tmpdir, "config.xml")
+    self.outputFile = os.path.join(self.tmpdir, "signed.xml")
+    f = open(self.inputFile, "w")
+    f.write(CONFIG)
+    f.close()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def options(self, **kwargs):
+    # Only what sign needs: no GSA host name, user name or password
+    values = {"inputFile": self.inputFile,
+              "outputFile": self.outputFile,
+              "signpassword": "password1"}
+    values.update(kwargs)
+    return optparse.Values(values)
+
+  def testSign(self):
+    gsa_admin.HANDLERS["sign"](self.options())
+    signed = gsa_admin.gsaConfig(self.outputFile)
+    self.assert_(signed.verifySignature("password1"))
+    self.failIf(signed.verifySignature("password2"))
+
+  def testSignWithoutInputFile(self):
+    self.assertRaises(gsa_admin.UsageError, gsa_admin.do_sign,
+                      self.options(inputFile=None))
+    self.failIf(os.path.exists(self.outputFile))
+
+  def testSignWithoutOutputFile(self):
+    self.assertRaises(gsa_admin.UsageError, gsa_admin.do_sign,
+                      self.options(outputFile=None))
+
+  def testSignatureMatchesMinidom(self):
+    tested = 0
+    for seed in range(20000):
+      configXMLString = RandomConfig(seed).config()
+      # libxml2 merges adjacent CDATA sections, which minidom kept apart
+      if ']]><![CDATA[' in configXMLString:
+        continue
+      gsac = gsa_admin.gsaConfig()
+      gsac.configXMLString = configXMLString
+      self.assertEqual(gsac.computeSignature("password1"),
+                       minidomSignature(configXMLString, "password1"),
+                       configXMLString)
+      tested += 1
+    self.assert_(tested > 15000)
+
+
+if __name__ == '__main__':
+  unittest.main()